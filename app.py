@@ -1,71 +1,85 @@
 import streamlit as st
 import pandas as pd
+import altair as alt
 import requests
 import time
-from datetime import datetime, timezone, timedelta, date
+import io
+import os
+import secrets
+import threading
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, date
+from bank_rules import KST, digest_rows, pin_ok, rate_by_weeks, savings_interest
 
 # =========================
 # 설정
 # =========================
+# 저장소: "apps_script"(기본, 구글시트 웹앱) 또는 "sqlite"(자체 호스팅, 내장 DB)
+STORAGE = os.environ.get("BANK_STORAGE", "apps_script")
+SQLITE_PATH = os.environ.get("BANK_SQLITE_PATH", "bank.db")
+# 인증: "token"(login 후 세션 토큰) 또는 "pin"(매 요청 이름+PIN, login을 모르는 기존 웹앱용)
+AUTH_MODE = os.environ.get("BANK_AUTH", "token" if STORAGE == "sqlite" else "pin")
 WEBAPP_URL = "https://script.google.com/macros/s/AKfycbzwbS_dIJGHTe4oyNK9QMWm0CXqqjgMJ3p-q0MQANqZ0mUQhrHPOIHVSgcH41vrLep-/exec"
 
 st.set_page_config(page_title="학생 포인트 통장", layout="wide")
 st.title("🏦 학생 포인트 통장")
 
-KST = timezone(timedelta(hours=9))
-SESSION = requests.Session()
+_HTTP = threading.local()  # requests.Session은 스레드마다 따로(프리페치 스레드용)
+
+def http_session() -> requests.Session:
+    if not hasattr(_HTTP, "session"):
+        _HTTP.session = requests.Session()
+    return _HTTP.session
 
 # =========================
 # Utils
 # =========================
-def pin_ok(pin: str) -> bool:
-    return pin.isdigit() and len(pin) == 4
-
 def toast(msg: str, icon: str = "✅"):
     if hasattr(st, "toast"):
         st.toast(msg, icon=icon)
     else:
         st.success(msg)
 
+def parse_kst_datetime(val):
+    """ISO 문자열/datetime → KST datetime (실패하면 None)"""
+    if val is None or val == "":
+        return None
+    if isinstance(val, datetime):
+        return val.astimezone(KST) if val.tzinfo else val.replace(tzinfo=KST)
+    s = str(val).strip()
+    try:
+        if "T" in s and s.endswith("Z"):
+            return datetime.fromisoformat(s.replace("Z", "+00:00")).astimezone(KST)
+        dt = datetime.fromisoformat(s)
+        return dt.astimezone(KST) if dt.tzinfo else dt.replace(tzinfo=KST)
+    except Exception:
+        return None
+
 def format_kr_datetime(val) -> str:
     if val is None or val == "":
         return ""
-    if isinstance(val, datetime):
-        dt = val.astimezone(KST) if val.tzinfo else val.replace(tzinfo=KST)
-    else:
-        s = str(val).strip()
-        try:
-            if "T" in s and s.endswith("Z"):
-                dt = datetime.fromisoformat(s.replace("Z", "+00:00")).astimezone(KST)
-            else:
-                dt = datetime.fromisoformat(s)
-                dt = dt.astimezone(KST) if dt.tzinfo else dt.replace(tzinfo=KST)
-        except Exception:
-            return s
+    dt = parse_kst_datetime(val)
+    if dt is None:
+        return str(val).strip()
+    return kr_datetime_text(dt)
 
+def kr_datetime_text(dt: datetime) -> str:
+    """이미 파싱한 KST datetime → 화면용 문자열"""
     ampm = "오전" if dt.hour < 12 else "오후"
     hour12 = dt.hour % 12
     hour12 = 12 if hour12 == 0 else hour12
     return f"{dt.year}년 {dt.month:02d}월 {dt.day:02d}일 {ampm} {hour12:02d}시 {dt.minute:02d}분"
 
-def rate_by_weeks(weeks: int) -> float:
-    return weeks * 0.05  # 1주=5%
-
 def compute_preview(principal: int, weeks: int):
     r = rate_by_weeks(weeks)
-    interest = round(principal * r)
+    interest = savings_interest(principal, weeks)
     maturity = principal + interest
     maturity_date = (datetime.now(KST) + timedelta(days=weeks * 7)).date()
     return r, interest, maturity, maturity_date
 
-def parse_iso_to_date(iso_str: str):
-    try:
-        dt = datetime.fromisoformat(str(iso_str).replace("Z", "+00:00"))
-        return dt.date()
-    except Exception:
-        return None
-
-def build_df(headers, rows):
+def build_df(headers, rows, opening_balance: int = 0):
+    """opening_balance: 체크포인트(보관된 이전 기록) 잔액 → 총액 시작값"""
     if not rows:
         return pd.DataFrame(columns=["tx_id", "datetime", "memo", "deposit", "withdraw", "총액"])
 
@@ -83,11 +97,139 @@ def build_df(headers, rows):
     df["withdraw"] = df["withdraw"].astype(int)
 
     df["변동"] = df["deposit"] - df["withdraw"]
-    df["총액"] = df["변동"].cumsum()
+    df["총액"] = int(opening_balance) + df["변동"].cumsum()
 
+    df["_dt"] = df["datetime"].apply(parse_kst_datetime)  # 그래프용 원본 시각
     df["datetime"] = df["datetime"].apply(format_kr_datetime)
     return df
 
+def ledger_digest(headers, rows, checkpoint=None) -> dict:
+    """원본 거래 행 → 백엔드와 같은 digest (bank_rules.digest_rows)"""
+    idx = {h: i for i, h in enumerate(headers or [])}
+
+    def cell(row, key):
+        i = idx.get(key)
+        return row[i] if i is not None and i < len(row) else ""
+
+    def as_int(v):
+        try:
+            return int(float(v or 0))
+        except Exception:
+            return 0
+
+    cp = None
+    if checkpoint:
+        cp = {"balance": as_int(checkpoint.get("balance")), "archived_count": as_int(checkpoint.get("archived_count"))}
+    tuples = [(cell(r, "tx_id"), as_int(cell(r, "deposit")), as_int(cell(r, "withdraw"))) for r in rows or []]
+    return digest_rows(tuples, cp)
+
+ROSTER_NAME_COLS = ("name", "이름")
+ROSTER_PIN_COLS = ("pin", "비밀번호", "PIN")
+
+def parse_roster_csv(raw: bytes, existing):
+    """명단 CSV(이름[, PIN]) → [{"name","pin","note"}] (PIN 없으면 생성, 중복/형식 오류는 note에 표시)"""
+    df = None
+    for enc in ("utf-8-sig", "cp949"):
+        try:
+            df = pd.read_csv(io.BytesIO(raw), dtype=str, encoding=enc).fillna("")
+            break
+        except Exception:
+            continue
+    if df is None:
+        return None, "CSV를 읽지 못했어요. (UTF-8 또는 CP949)"
+
+    name_col = next((c for c in df.columns if str(c).strip() in ROSTER_NAME_COLS), None)
+    pin_col = next((c for c in df.columns if str(c).strip() in ROSTER_PIN_COLS), None)
+    if name_col is None:
+        return None, "CSV에 name(이름) 열이 필요해요."
+
+    existing = set(existing or [])
+    seen = set()
+    out = []
+    for _, r in df.iterrows():
+        nm = str(r[name_col]).strip()
+        pn = str(r[pin_col]).strip() if pin_col is not None else ""
+        if not nm:
+            continue
+        if pn and pn.isdigit() and len(pn) < 4:
+            pn = pn.zfill(4)  # 엑셀이 앞자리 0을 지운 경우
+        generated = not pn
+        if generated:
+            pn = f"{secrets.randbelow(10000):04d}"
+
+        if nm in seen:
+            note = "CSV 안에서 중복"
+        elif nm in existing:
+            note = "이미 있는 계정"
+        elif not pin_ok(pn):
+            note = "PIN은 4자리 숫자"
+        else:
+            note = ""
+        seen.add(nm)
+        out.append({"name": nm, "pin": pn, "generated": generated, "note": note})
+    return out, ""
+
+SAVINGS_COLS = ["savings_id", "principal", "weeks", "interest", "maturity_datetime", "status"]
+
+def index_savings(savings) -> dict:
+    """적금 목록을 새로고침마다 한 번만 파싱 → 상태별(만기일 순) 표 + 합계"""
+    sv = pd.DataFrame(savings or []).reindex(columns=SAVINGS_COLS)
+    for c in ("principal", "weeks", "interest"):
+        sv[c] = pd.to_numeric(sv[c], errors="coerce").fillna(0).astype(int)
+    sv["status"] = sv["status"].fillna("").astype(str).str.lower()
+    sv["payout"] = sv["principal"] + sv["interest"]
+    sv["maturity"] = pd.to_datetime(sv["maturity_datetime"].apply(parse_kst_datetime), utc=True).dt.tz_convert(KST)
+    sv["만기일"] = [
+        kr_datetime_text(m) if pd.notna(m) else ("" if pd.isna(raw) else str(raw))
+        for m, raw in zip(sv["maturity"], sv["maturity_datetime"])
+    ]
+    sv = sv.sort_values("maturity", kind="stable")
+
+    active = sv[sv["status"] == "active"]
+    nxt = active.dropna(subset=["maturity"]).head(1)
+    return {
+        "active": active,
+        "matured": sv[sv["status"] == "matured"],
+        "canceled": sv[sv["status"] == "canceled"],
+        "active_principal": int(active["principal"].sum()),
+        "active_payout": int(active["payout"].sum()),
+        "next_maturity": nxt.iloc[0] if len(nxt) else None,
+    }
+
+def savings_payout_until(index: dict, until: date) -> int:
+    """until 날짜(포함)까지 만기되는 진행 중 적금 수령액(원금+이자)"""
+    active = index["active"]
+    cutoff = pd.Timestamp(until + timedelta(days=1)).tz_localize(KST)
+    return int(active.loc[active["maturity"] < cutoff, "payout"].sum())
+
+def lttb_indices(xs, ys, budget: int):
+    """Largest-Triangle-Three-Buckets: 모양을 살리면서 budget개 점만 남길 인덱스"""
+    n = len(xs)
+    if budget >= n or budget < 3:
+        return list(range(n))
+
+    every = (n - 2) / (budget - 2)
+    picked = [0]
+    a = 0
+    for i in range(budget - 2):
+        # 다음 버킷 평균점
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / span
+        avg_y = sum(ys[avg_start:avg_end]) / span
+
+        # 현재 버킷에서 삼각형 넓이가 가장 큰 점
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        picked.append(best)
+        a = best
+    picked.append(n - 1)
+    return picked
+
 def clamp01(x: float) -> float:
     try:
         if x is None:
@@ -101,19 +243,44 @@ def clamp01(x: float) -> float:
 # =========================
 # API wrappers
 # =========================
+# 저장소 백엔드: get(params) / post(payload) → {"ok": ..., ...} dict
+class AppsScriptBackend:
+    def __init__(self, url: str):
+        self.url = url
+
+    def get(self, params: dict):
+        r = http_session().get(self.url, params=params, timeout=60)
+        try:
+            return r.json()
+        except Exception:
+            return {"ok": False, "error": "JSON parse 실패", "raw": r.text[:300]}
+
+    def post(self, payload: dict):
+        r = http_session().post(self.url, json=payload, timeout=60)
+        try:
+            return r.json()
+        except Exception:
+            return {"ok": False, "error": "JSON parse 실패", "raw": r.text[:300]}
+
+@st.cache_resource(show_spinner=False)
+def storage_backend(kind: str):
+    if kind == "sqlite":
+        from sqlite_backend import SqliteBackend
+        return SqliteBackend(
+            SQLITE_PATH,
+            admin_pin=os.environ.get("BANK_ADMIN_PIN", ""),
+            token_secret=os.environ.get("BANK_TOKEN_SECRET", ""),
+        )
+    return AppsScriptBackend(WEBAPP_URL)
+
+# 프리페치 스레드에서도 쓰도록 메인 스레드에서 한 번 잡아 둠
+BACKEND = storage_backend(STORAGE)
+
 def api_get(params: dict):
-    r = SESSION.get(WEBAPP_URL, params=params, timeout=60)
-    try:
-        return r.json()
-    except Exception:
-        return {"ok": False, "error": "JSON parse 실패", "raw": r.text[:300]}
+    return BACKEND.get(params)
 
 def api_post(payload: dict):
-    r = SESSION.post(WEBAPP_URL, json=payload, timeout=60)
-    try:
-        return r.json()
-    except Exception:
-        return {"ok": False, "error": "JSON parse 실패", "raw": r.text[:300]}
+    return BACKEND.post(payload)
 
 # 캐시(자주 안 바뀌는 것)
 @st.cache_data(ttl=30, show_spinner=False)
@@ -131,39 +298,61 @@ def api_create_account(name, pin):
 def api_delete_account(name, pin):
     return api_post({"action": "delete_account", "name": name, "pin": pin})
 
-def api_add_tx(name, pin, memo, deposit, withdraw):
+# 세션 토큰 (로그인 1번 → 이후 요청은 토큰만 전송)
+# login을 모르는 이전 웹앱이면 token 자리에 {"name","pin"}을 넣어 예전 방식으로 보냄
+def auth_params(token) -> dict:
+    if isinstance(token, dict):
+        return {"name": token["name"], "pin": token["pin"]}
+    return {"token": token}
+
+def api_login(name, pin):
+    # {"ok": True, "token": "...", "expires_at": "ISO"}
+    return api_post({"action": "login", "name": name, "pin": pin})
+
+def api_refresh_token(token):
+    return api_post({"action": "refresh_token", "token": token})
+
+def api_logout(token):
+    return api_post({"action": "logout", "token": token})
+
+def api_add_tx(token, memo, deposit, withdraw):
     return api_post({
         "action": "add_transaction",
-        "name": name, "pin": pin,
+        **auth_params(token),
         "memo": memo,
         "deposit": int(deposit),
         "withdraw": int(withdraw)
     })
 
-def api_get_txs(name, pin):
-    return api_get({"action": "get_transactions", "name": name, "pin": pin})
+def api_get_txs(token):
+    # 최근 행 + checkpoint({"balance", "as_of", "archived_count"}) (보관 이전 기록은 제외)
+    return api_get({"action": "get_transactions", **auth_params(token)})
+
+def api_get_archived_txs(token):
+    # 보관 포함 전체 내역 (필요할 때만)
+    return api_get({"action": "get_archived_transactions", **auth_params(token)})
 
-def api_undo_last_n(name, pin, n):
-    return api_post({"action": "undo_last_n", "name": name, "pin": pin, "n": int(n)})
+def api_undo_last_n(token, n):
+    return api_post({"action": "undo_last_n", **auth_params(token), "n": int(n)})
 
-def api_savings_list(name, pin):
-    return api_get({"action": "list_savings", "name": name, "pin": pin})
+def api_savings_list(token):
+    return api_get({"action": "list_savings", **auth_params(token)})
 
-def api_savings_create(name, pin, principal, weeks):
-    return api_post({"action": "savings_create", "name": name, "pin": pin,
+def api_savings_create(token, principal, weeks):
+    return api_post({"action": "savings_create", **auth_params(token),
                      "principal": int(principal), "weeks": int(weeks)})
 
-def api_savings_cancel(name, pin, savings_id):
-    return api_post({"action": "savings_cancel", "name": name, "pin": pin, "savings_id": savings_id})
+def api_savings_cancel(token, savings_id):
+    return api_post({"action": "savings_cancel", **auth_params(token), "savings_id": savings_id})
 
-def api_process_maturities(name, pin):
-    return api_get({"action": "process_maturities", "name": name, "pin": pin})
+def api_process_maturities(token):
+    return api_get({"action": "process_maturities", **auth_params(token)})
 
-def api_get_goal(name, pin):
-    return api_get({"action": "get_goal", "name": name, "pin": pin})
+def api_get_goal(token):
+    return api_get({"action": "get_goal", **auth_params(token)})
 
-def api_set_goal(name, pin, goal_amount, goal_date_str):
-    return api_post({"action": "set_goal", "name": name, "pin": pin,
+def api_set_goal(token, goal_amount, goal_date_str):
+    return api_post({"action": "set_goal", **auth_params(token),
                      "goal_amount": int(goal_amount), "goal_date": goal_date_str})
 
 # Admin API
@@ -174,6 +363,18 @@ def api_admin_reset_pin(admin_pin, name, new_pin):
     return api_post({"action": "admin_reset_pin", "admin_pin": admin_pin,
                      "name": name, "new_pin": new_pin})
 
+def api_admin_ledger_digests(admin_pin):
+    # {"ok": True, "digests": {name: {"count": n, "hash": "xxxxxxxx"}}}
+    return api_get({"action": "admin_ledger_digests", "admin_pin": admin_pin})
+
+def api_admin_checkpoint(admin_pin, keep_days):
+    # keep_days 이전 거래를 계정별 체크포인트 잔액으로 접고 보관 시트로 이동
+    return api_post({"action": "admin_checkpoint", "admin_pin": admin_pin, "keep_days": int(keep_days)})
+
+def api_admin_bulk_create_accounts(admin_pin, accounts):
+    # accounts: [{"name","pin"}] → {"ok": True, "results": [{"name","ok","error"}]}
+    return api_post({"action": "admin_bulk_create_accounts", "admin_pin": admin_pin, "accounts": accounts})
+
 def api_admin_backup(admin_pin):
     return api_post({"action": "admin_backup", "admin_pin": admin_pin})
 
@@ -191,16 +392,25 @@ def api_admin_delete_template(admin_pin, template_id):
 # =========================
 # Session init
 # =========================
-if "saved_pins" not in st.session_state:
-    st.session_state.saved_pins = {}
+if "tokens" not in st.session_state:
+    # {name: {"token":..., "exp": datetime, "remember": bool}}
+    st.session_state.tokens = {}
 
 if "admin_ok" not in st.session_state:
     st.session_state.admin_ok = False
 
 if "data" not in st.session_state:
-    # {name: {"df":..., "balance":..., "savings":..., "goal":..., "ts":...}}
+    # {name: {"df":..., "balance":..., "savings":..., "savings_index":..., "goal":..., "ts":...}}
     st.session_state.data = {}
 
+if "prefetch" not in st.session_state:
+    # {name: {"future": Future, "ts": datetime}}
+    st.session_state.prefetch = {}
+
+if "prefetch_last" not in st.session_state:
+    # {name: 마지막 예약 시각} (재예약 쿨다운)
+    st.session_state.prefetch_last = {}
+
 if "last_maturity_check" not in st.session_state:
     st.session_state.last_maturity_check = {}
 
@@ -213,7 +423,163 @@ if "delete_confirm" not in st.session_state:
 if "bulk_confirm" not in st.session_state:
     st.session_state.bulk_confirm = False
 
-def refresh_account_data(name: str, pin: str, force: bool = False):
+if "checkpoint_confirm" not in st.session_state:
+    st.session_state.checkpoint_confirm = False
+
+TOKEN_REFRESH_MARGIN = 120  # 만료 2분 전이면 미리 갱신
+TOKEN_AUTH_ERRORS = ("TOKEN_EXPIRED", "TOKEN_INVALID")
+
+def parse_token_expiry(val) -> datetime:
+    try:
+        dt = datetime.fromisoformat(str(val).replace("Z", "+00:00"))
+        return dt.astimezone(KST) if dt.tzinfo else dt.replace(tzinfo=KST)
+    except Exception:
+        return datetime.now(KST) + timedelta(minutes=10)
+
+def pin_fingerprint(name: str, pin: str) -> str:
+    """로그인에 쓴 PIN이 바뀌었는지 비교용(PIN 자체는 토큰 모드에서 저장 안 함)"""
+    return hashlib.sha256(f"{name}:{pin}".encode()).hexdigest()
+
+def store_token(name: str, res: dict, remember: bool, pin: str):
+    st.session_state.tokens[name] = {
+        "token": res["token"],
+        "exp": parse_token_expiry(res.get("expires_at")),
+        "remember": remember,
+        "pin_fp": pin_fingerprint(name, pin),
+    }
+
+def is_auth_error(res) -> bool:
+    return isinstance(res, dict) and res.get("error_code") in TOKEN_AUTH_ERRORS
+
+def get_session_token(name: str):
+    """저장된 토큰 반환(만료 임박이면 갱신, 만료/거부면 삭제 후 "")"""
+    tok = st.session_state.tokens.get(name)
+    if not tok:
+        return ""
+    if tok.get("legacy"):
+        return tok["token"]
+    left = (tok["exp"] - datetime.now(KST)).total_seconds()
+    if left <= 0:
+        st.session_state.tokens.pop(name, None)
+        return ""
+    if left < TOKEN_REFRESH_MARGIN:
+        res = api_refresh_token(tok["token"])
+        if res.get("ok") and res.get("token"):
+            st.session_state.tokens[name].update(token=res["token"], exp=parse_token_expiry(res.get("expires_at")))
+        elif is_auth_error(res):
+            st.session_state.tokens.pop(name, None)
+            return ""
+    return st.session_state.tokens[name]["token"]
+
+def login_with_pin(name: str, pin: str, remember: bool):
+    """PIN으로 로그인 → 토큰 저장. (token, error) 반환"""
+    if AUTH_MODE == "pin":
+        # 토큰 없는 방식: token 자리에 {"name","pin"}을 넣어 매 요청 이름+PIN 전송
+        st.session_state.tokens[name] = {
+            "token": {"name": name, "pin": pin},
+            "exp": datetime.max.replace(tzinfo=KST),
+            "remember": remember,
+            "pin_fp": pin_fingerprint(name, pin),
+            "legacy": True,
+        }
+        return st.session_state.tokens[name]["token"], ""
+    res = api_login(name, pin)
+    if not res.get("ok") or not res.get("token"):
+        return "", res.get("error", "로그인 실패")
+    store_token(name, res, remember, pin)
+    return res["token"], ""
+
+# 프리페치(다음에 볼 가능성이 큰 계정을 미리 불러오기)
+PREFETCH_WORKERS = 2       # 전체 동시 요청 상한(모든 접속 공유)
+PREFETCH_PER_RUN = 2       # 한 번 리런에 새로 예약하는 계정 수
+PREFETCH_MAX_HELD = 6      # 세션당 보관하는 프리페치 결과 수(메모리 상한)
+PREFETCH_FRESH_SEC = 20    # 이 시간 안의 결과만 화면에 사용
+PREFETCH_COOLDOWN_SEC = 180  # 같은 계정은 이 시간 안에 다시 예약하지 않음(안 쓰고 버린 경우 포함)
+
+@st.cache_resource(show_spinner=False)
+def prefetch_executor():
+    return ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+def fetch_account_bundle(token: str) -> dict:
+    """거래/적금/목표 API 응답 묶음 (session_state 안 건드림 → 스레드에서 호출 가능)"""
+    tx_res = api_get_txs(token)
+    if not tx_res.get("ok"):
+        return {"tx": tx_res}
+    return {"tx": tx_res, "savings": api_savings_list(token), "goal": api_get_goal(token)}
+
+def prefetch_job(token, submitted: datetime):
+    """큐에서 너무 오래 기다린 작업은 요청 없이 건너뜀(결과가 어차피 버려지므로)"""
+    if (datetime.now(KST) - submitted).total_seconds() > PREFETCH_FRESH_SEC:
+        return None
+    bundle = fetch_account_bundle(token)
+    bundle["done_ts"] = datetime.now(KST)
+    return bundle
+
+def drop_prefetch(name: str = None):
+    """쓰기 이후 이전에 받아 둔 프리페치는 버림 (name=None이면 전체)"""
+    held = st.session_state.prefetch
+    for k in ([name] if name is not None else list(held)):
+        item = held.pop(k, None)
+        if item:
+            item["future"].cancel()
+
+def take_prefetched(name: str):
+    """끝난 신선한 프리페치 결과가 있으면 꺼내기(없으면 None)"""
+    item = st.session_state.prefetch.get(name)
+    if not item or not item["future"].done():
+        return None
+    st.session_state.prefetch.pop(name, None)
+    try:
+        bundle = item["future"].result()
+    except Exception:
+        return None
+    if not bundle or (datetime.now(KST) - bundle["done_ts"]).total_seconds() > PREFETCH_FRESH_SEC:
+        return None
+    return bundle
+
+def prefetch_accounts(current: str, options: list):
+    """현재 계정의 이웃(다음/이전) → 로그인 유지 계정 순으로 몇 개만 미리 불러오기"""
+    now = datetime.now(KST)
+    held = st.session_state.prefetch
+
+    # 오래된 결과/시작 못 한 작업 정리 + 메모리 상한
+    for k, v in list(held.items()):
+        fut = v["future"]
+        if fut.done():
+            bundle = None if fut.cancelled() or fut.exception() else fut.result()
+            if not bundle or (now - bundle["done_ts"]).total_seconds() > PREFETCH_FRESH_SEC:
+                held.pop(k, None)
+        elif (now - v["ts"]).total_seconds() > PREFETCH_FRESH_SEC:
+            fut.cancel()  # 아직 시작 안 했으면 취소(이미 실행 중이면 결과만 버림)
+            held.pop(k, None)
+
+    candidates = []
+    if current in options:
+        i = options.index(current)
+        candidates += [options[j] for j in (i + 1, i - 1) if 0 <= j < len(options)]
+    candidates += [k for k, v in st.session_state.tokens.items() if v.get("remember")]
+
+    scheduled = 0
+    for cand in dict.fromkeys(candidates):
+        if scheduled >= PREFETCH_PER_RUN or len(held) >= PREFETCH_MAX_HELD:
+            break
+        if cand == current or cand in held:
+            continue
+        last = st.session_state.prefetch_last.get(cand)
+        if last and (now - last).total_seconds() < PREFETCH_COOLDOWN_SEC:
+            continue
+        slot_ts = st.session_state.data.get(cand, {}).get("ts")
+        if slot_ts and (now - slot_ts).total_seconds() < PREFETCH_FRESH_SEC:
+            continue
+        # 토큰 갱신 요청은 하지 않음: 없거나 곧 만료되는 토큰은 건너뜀
+        tok = st.session_state.tokens.get(cand)
+        if not tok or (tok["exp"] - now).total_seconds() < TOKEN_REFRESH_MARGIN:
+            continue
+        held[cand] = {"future": prefetch_executor().submit(prefetch_job, tok["token"], now), "ts": now}
+        st.session_state.prefetch_last[cand] = now
+        scheduled += 1
+
+def refresh_account_data(name: str, token: str, force: bool = False):
     """한 계정 화면 데이터(거래/적금/목표)를 session_state에 저장"""
     now = datetime.now(KST)
     slot = st.session_state.data.get(name, {})
@@ -222,43 +588,151 @@ def refresh_account_data(name: str, pin: str, force: bool = False):
     # 너무 자주 호출 방지(3초)
     if (not force) and last_ts and (now - last_ts).total_seconds() < 3:
         return
+    if force:
+        st.session_state.pop(f"archive_{name}", None)  # 거래 변경 → 전체 내역 다시 불러오기
+        drop_prefetch(name)
+
+    bundle = None if force else take_prefetched(name)
+    if bundle is None:
+        bundle = fetch_account_bundle(token)
 
     # 1) 거래
-    tx_res = api_get_txs(name, pin)
+    tx_res = bundle["tx"]
+    if is_auth_error(tx_res):
+        st.session_state.tokens.pop(name, None)
     if not tx_res.get("ok"):
         st.session_state.data[name] = {"error": tx_res.get("error", "내역 로드 실패"), "ts": now}
         return
 
     headers = tx_res.get("headers", ["tx_id", "datetime", "memo", "deposit", "withdraw"])
     rows = tx_res.get("rows", [])
-    df = build_df(headers, rows)
+    checkpoint = tx_res.get("checkpoint") or None
+    opening = int(float(checkpoint.get("balance", 0) or 0)) if checkpoint else 0
+    df = build_df(headers, rows, opening_balance=opening)
+    digest = ledger_digest(headers, rows, checkpoint)
 
-    balance = int(df["총액"].iloc[-1]) if len(df) else 0
+    balance = int(df["총액"].iloc[-1]) if len(df) else opening
 
     # 2) 적금
-    sres = api_savings_list(name, pin)
+    sres = bundle["savings"]
     savings = sres.get("savings", []) if isinstance(sres, dict) and sres.get("ok") else []
 
     # 3) 목표
-    gres = api_get_goal(name, pin)
+    gres = bundle["goal"]
     goal = gres if isinstance(gres, dict) and gres.get("ok") else {"ok": False, "error": (gres.get("error") if isinstance(gres, dict) else "목표 로드 실패")}
 
     st.session_state.data[name] = {
         "df": df,
         "balance": balance,
         "savings": savings,
+        "savings_index": index_savings(savings),
         "goal": goal,
+        "checkpoint": checkpoint,
+        "digest": digest,
         "ts": now
     }
 
-def maybe_check_maturities(name: str, pin: str):
+def reconcile_cached_accounts(admin_pin: str):
+    """서버 digest 한 번 조회 → 다른 계정만 다시 불러오기(로그인된 계정) / 나머지는 캐시 폐기"""
+    res = api_admin_ledger_digests(admin_pin)
+    if not res.get("ok"):
+        return {"ok": False, "error": res.get("error", "digest 조회 실패")}
+
+    remote = res.get("digests", {}) or {}
+    report = []
+    checked = 0
+    for name, slot in list(st.session_state.data.items()):
+        local = slot.get("digest")
+        if not local:
+            continue
+        checked += 1
+        server = remote.get(name)
+        if server and int(server.get("count", -1)) == local["count"] and str(server.get("hash", "")) == local["hash"]:
+            continue
+
+        row = {
+            "계정": name,
+            "로컬 행 수": local["count"],
+            "서버 행 수": int(server.get("count", 0)) if server else None,
+        }
+        token = get_session_token(name)
+        if server is None:
+            st.session_state.data.pop(name, None)
+            row["조치"] = "서버에 없음 → 캐시 삭제"
+        elif token:
+            refresh_account_data(name, token, force=True)
+            fixed = st.session_state.data.get(name, {}).get("digest") == {
+                "count": int(server.get("count", 0)), "hash": str(server.get("hash", ""))
+            }
+            row["조치"] = "다시 불러옴" if fixed else "다시 불러옴(여전히 불일치)"
+        else:
+            st.session_state.data.pop(name, None)
+            row["조치"] = "로그인 안 됨 → 캐시 삭제"
+        report.append(row)
+
+    return {"ok": True, "checked": checked, "mismatches": report}
+
+def maybe_check_maturities(name: str, token: str):
     """만기 자동 반환을 매 리런마다 하지 않도록 2분에 한 번만"""
     now = datetime.now(KST)
     last = st.session_state.last_maturity_check.get(name)
     if last and (now - last).total_seconds() < 120:
         return None
     st.session_state.last_maturity_check[name] = now
-    return api_process_maturities(name, pin)
+    res = api_process_maturities(token)
+    if res.get("ok") and res.get("matured_count", 0) > 0:
+        drop_prefetch(name)  # 만기 지급 전에 받아 둔 내역은 쓰지 않음
+    return res
+
+# =========================
+# 잔액 그래프
+# =========================
+CHART_POINTS = 200  # 그래프에 보내는 최대 점 개수
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def balance_chart_points(name: str, ledger_version: str, _df, budget: int = CHART_POINTS):
+    """(계정, 장부 버전)별로 한 번만 다운샘플링 (_df는 해시 안 함)"""
+    pts = _df[["_dt", "총액"]].dropna(subset=["_dt"])
+    if pts.empty:
+        return pd.DataFrame(columns=["시각", "총액"])
+    xs = [dt.timestamp() for dt in pts["_dt"]]
+    ys = [int(v) for v in pts["총액"]]
+    keep = lttb_indices(xs, ys, budget)
+    return pd.DataFrame({
+        "시각": [pts["_dt"].iloc[i].replace(tzinfo=None) for i in keep],  # KST 그대로 표시
+        "총액": [ys[i] for i in keep],
+    })
+
+def balance_chart(points, savings_index, goal):
+    layers = [
+        alt.Chart(points).mark_line(point=len(points) <= 30).encode(
+            x=alt.X("시각:T", title=None),
+            y=alt.Y("총액:Q", title="잔액"),
+            tooltip=[alt.Tooltip("시각:T", format="%Y-%m-%d %H:%M"), "총액:Q"],
+        )
+    ]
+
+    marks = []
+    for m_dt, payout in savings_index["active"].dropna(subset=["maturity"])[["maturity", "payout"]].itertuples(index=False):
+        marks.append({"시각": m_dt.tz_localize(None), "종류": "적금", "내용": f"적금 만기 +{int(payout)}"})
+    if goal.get("ok") and goal.get("goal_date"):
+        g_dt = parse_kst_datetime(goal.get("goal_date"))
+        if g_dt:
+            marks.append({"시각": g_dt.replace(tzinfo=None), "종류": "목표", "내용": f"목표일 ({int(goal.get('goal_amount', 0) or 0)})"})
+    if marks:
+        layers.append(
+            alt.Chart(pd.DataFrame(marks)).mark_rule(strokeDash=[4, 4]).encode(
+                x="시각:T",
+                color=alt.Color("종류:N", scale=alt.Scale(domain=["적금", "목표"], range=["#2e7d32", "#c62828"]), legend=None),
+                tooltip=["내용:N", alt.Tooltip("시각:T", format="%Y-%m-%d")],
+            )
+        )
+    goal_amount = int(goal.get("goal_amount", 0) or 0) if goal.get("ok") else 0
+    if goal_amount > 0:
+        layers.append(
+            alt.Chart(pd.DataFrame({"총액": [goal_amount]})).mark_rule(color="#c62828", opacity=0.4).encode(y="총액:Q")
+        )
+    return alt.layer(*layers)
 
 # =========================
 # Sidebar: 계정 + 관리자
@@ -304,9 +778,10 @@ with st.sidebar:
                 else:
                     res = api_delete_account(new_name, new_pin)
                     if res.get("ok"):
+                        drop_prefetch(new_name)
                         toast("삭제 완료!", icon="🗑️")
                         st.session_state.delete_confirm = False
-                        st.session_state.saved_pins.pop(new_name, None)
+                        st.session_state.tokens.pop(new_name, None)
                         st.session_state.data.pop(new_name, None)
                         st.session_state.pop(f"pin_{new_name}", None)
                         st.session_state.pop(f"remember_{new_name}", None)
@@ -421,6 +896,55 @@ with st.sidebar:
 
             st.divider()
 
+            # ---- 명단 일괄 등록
+            st.subheader("👥 명단 일괄 등록(CSV)")
+            st.caption("열: name(이름), pin(비밀번호, 비우면 자동 생성)")
+            roster_file = st.file_uploader("명단 CSV", type=["csv"], key=f"roster_file_{st.session_state.get('roster_upload_n', 0)}")
+            if roster_file is not None:
+                roster_accounts = api_list_accounts_cached()
+                roster, err = parse_roster_csv(roster_file.getvalue(), roster_accounts.get("accounts", []) if roster_accounts.get("ok") else [])
+                if err:
+                    st.error(err)
+                elif not roster:
+                    st.info("CSV에 등록할 이름이 없어요.")
+                else:
+                    valid = [r for r in roster if not r["note"]]
+                    st.dataframe(
+                        pd.DataFrame([{"이름": r["name"], "PIN": "자동 생성" if r["generated"] else "****",
+                                       "확인": r["note"] or "OK"} for r in roster]),
+                        use_container_width=True, hide_index=True,
+                    )
+                    st.caption(f"등록 가능 {len(valid)}명 / 제외 {len(roster) - len(valid)}명")
+                    if st.button("일괄 등록", disabled=not valid):
+                        res = api_admin_bulk_create_accounts(admin_pin, [{"name": r["name"], "pin": r["pin"]} for r in valid])
+                        if res.get("ok"):
+                            by_name = {x.get("name"): x for x in res.get("results", [])}
+                            st.session_state["roster_result"] = [
+                                {"이름": r["name"], "PIN": "" if r["note"] else r["pin"],
+                                 "결과": r["note"] or ("생성" if by_name.get(r["name"], {}).get("ok")
+                                                      else by_name.get(r["name"], {}).get("error", "실패"))}
+                                for r in roster
+                            ]
+                            # 업로더 키를 바꿔서 파일 비우기(다시 파싱하지 않도록)
+                            st.session_state["roster_upload_n"] = st.session_state.get("roster_upload_n", 0) + 1
+                            api_list_accounts_cached.clear()
+                            st.rerun()
+                        else:
+                            st.error(res.get("error", "일괄 등록 실패"))
+
+            if st.session_state.get("roster_result"):
+                result_df = pd.DataFrame(st.session_state["roster_result"])
+                ok_count = int((result_df["결과"] == "생성").sum())
+                st.success(f"명단 등록 완료! ({ok_count}/{len(result_df)}명)")
+                st.dataframe(result_df, use_container_width=True, hide_index=True)
+                st.download_button("결과(PIN 포함) 내려받기", result_df.to_csv(index=False).encode("utf-8-sig"),
+                                   file_name="roster_result.csv", mime="text/csv")
+                if st.button("결과 닫기", key="roster_result_close"):
+                    st.session_state.pop("roster_result", None)
+                    st.rerun()
+
+            st.divider()
+
             # ---- 전체 학생 일괄 지급
             st.subheader("🎁 전체 학생 일괄 지급")
             bulk_amount = st.number_input("지급 포인트(+)", min_value=1, step=1, value=10, key="bulk_amount")
@@ -436,6 +960,7 @@ with st.sidebar:
                     if st.button("예", key="bulk_yes"):
                         res = api_admin_bulk_deposit(admin_pin, bulk_amount, bulk_memo)
                         if res.get("ok"):
+                            drop_prefetch()
                             toast(f"일괄 지급 완료! ({res.get('count')}명)", icon="🎉")
                             st.session_state.bulk_confirm = False
                             st.rerun()
@@ -448,14 +973,54 @@ with st.sidebar:
 
             # ---- 백업
             st.subheader("💾 백업")
-            if st.button("구글시트 백업 만들기"):
+            if st.button("구글시트 백업 만들기" if STORAGE != "sqlite" else "DB 백업 만들기"):
                 res = api_admin_backup(admin_pin)
                 if res.get("ok"):
                     toast(f"백업 생성: {res.get('backup_name')}", icon="💾")
-                    st.info("Drive에 백업 파일이 생성되었습니다.")
+                    st.info("Drive에 백업 파일이 생성되었습니다." if STORAGE != "sqlite" else "DB 폴더에 백업 파일이 생성되었습니다.")
                 else:
                     st.error(res.get("error", "백업 실패"))
 
+            # ---- 장부 정리
+            st.subheader("📦 장부 정리(체크포인트)")
+            st.caption("오래된 거래를 잔액 체크포인트로 접고 보관 기록으로 옮겨요. 필요할 때 직접 실행해 주세요. (전체 내역은 계속 볼 수 있어요)")
+            keep_days = st.number_input("최근 며칠 거래는 그대로 둘까요?", min_value=7, step=7, value=28, key="cp_keep_days")
+            if st.button("체크포인트 만들기"):
+                st.session_state.checkpoint_confirm = True
+
+            if st.session_state.checkpoint_confirm:
+                st.warning(f"정말로 {int(keep_days)}일 이전 거래를 모두 보관하시겠습니까?")
+                st.caption("※ 보관된 거래는 되돌리기(undo)할 수 없어요.")
+                y, n = st.columns(2)
+                with y:
+                    if st.button("예", key="checkpoint_yes"):
+                        res = api_admin_checkpoint(admin_pin, keep_days)
+                        if res.get("ok"):
+                            toast(f"장부 정리 완료! ({res.get('archived', 0)}건 보관)", icon="📦")
+                            st.session_state.checkpoint_confirm = False
+                            st.session_state.data = {}
+                            drop_prefetch()
+                            st.rerun()
+                        else:
+                            st.error(res.get("error", "장부 정리 실패"))
+                with n:
+                    if st.button("아니오", key="checkpoint_no"):
+                        st.session_state.checkpoint_confirm = False
+                        st.rerun()
+
+            # ---- 캐시 점검
+            st.subheader("🔄 캐시 점검(서버와 비교)")
+            st.caption("계정별 요약값(행 수+해시)만 한 번에 받아 비교하고, 다른 계정만 다시 불러와요.")
+            if st.button("캐시 점검 실행"):
+                res = reconcile_cached_accounts(admin_pin)
+                if not res.get("ok"):
+                    st.error(res.get("error", "캐시 점검 실패"))
+                elif res["mismatches"]:
+                    st.warning(f"불일치 {len(res['mismatches'])}건 발견")
+                    st.dataframe(pd.DataFrame(res["mismatches"]), use_container_width=True, hide_index=True)
+                else:
+                    toast(f"모든 캐시 일치 ({res['checked']}개 계정)", icon="🔄")
+
             # ---- PIN 재설정
             st.subheader("🔧 PIN 재설정")
             target = st.text_input("대상 학생 이름", key="reset_target").strip()
@@ -468,8 +1033,9 @@ with st.sidebar:
                 else:
                     res = api_admin_reset_pin(admin_pin, target, newp)
                     if res.get("ok"):
+                        drop_prefetch(target)
                         toast("PIN 변경 완료!", icon="🔧")
-                        st.session_state.saved_pins.pop(target, None)
+                        st.session_state.tokens.pop(target, None)
                     else:
                         st.error(res.get("error", "PIN 변경 실패"))
 
@@ -504,31 +1070,56 @@ else:
 
 st.markdown(f"## 🧾 {name} 통장")
 
-# PIN
-saved = st.session_state.saved_pins.get(name, "")
-pin_key = f"pin_{name}"
-if pin_key not in st.session_state and saved:
-    st.session_state[pin_key] = saved
-
-pin = st.text_input("비밀번호(4자리) 입력(조회/저장용)", type="password", key=pin_key).strip()
-remember = st.checkbox("PIN 기억하기(이번 접속 동안)", value=bool(saved), key=f"remember_{name}")
+# 로그인(PIN → 세션 토큰)
+# 기억하지 않은 다른 계정 토큰은 계정 전환 시 버림
+for other in [k for k, v in st.session_state.tokens.items() if k != name and not v.get("remember")]:
+    st.session_state.tokens.pop(other, None)
 
-if remember and pin_ok(pin):
-    st.session_state.saved_pins[name] = pin
-if not remember:
-    st.session_state.saved_pins.pop(name, None)
+token = get_session_token(name)
+pin_key = f"pin_{name}"
 
-if not pin_ok(pin):
-    st.info("비밀번호(4자리 숫자)를 입력하면 통장 기능이 활성화돼요.")
-    st.stop()
+if token and st.session_state.tokens[name].get("remember"):
+    st.caption("🔐 로그인 유지 중(이번 접속 동안)")
+    if st.button("로그아웃", key=f"logout_{name}"):
+        if not st.session_state.tokens[name].get("legacy"):
+            api_logout(token)
+        st.session_state.tokens.pop(name, None)
+        st.session_state.data.pop(name, None)
+        st.session_state.pop(pin_key, None)
+        st.rerun()
+else:
+    pin = st.text_input("비밀번호(4자리) 입력(조회/저장용)", type="password", key=pin_key).strip()
+    remember = st.checkbox("로그인 유지(이번 접속 동안)", value=False, key=f"remember_{name}")
+
+    if not pin_ok(pin):
+        st.session_state.tokens.pop(name, None)
+        st.info("비밀번호(4자리 숫자)를 입력하면 통장 기능이 활성화돼요.")
+        st.stop()
+
+    # 입력한 PIN이 로그인 때와 다르면 다시 로그인
+    if token and st.session_state.tokens[name].get("pin_fp") != pin_fingerprint(name, pin):
+        if not st.session_state.tokens[name].get("legacy"):
+            api_logout(token)
+        st.session_state.tokens.pop(name, None)
+        st.session_state.data.pop(name, None)
+        drop_prefetch(name)
+        token = ""
+
+    if not token:
+        token, err = login_with_pin(name, pin, remember)
+        if not token:
+            st.error(err)
+            st.stop()
+    st.session_state.tokens[name]["remember"] = remember
 
 # 만기 자동 처리(2분에 1번만)
-mat = maybe_check_maturities(name, pin)
+mat = maybe_check_maturities(name, token)
 if mat and mat.get("ok") and mat.get("matured_count", 0) > 0:
     st.success(f"🎉 만기 도착! 적금 {mat['matured_count']}건 자동 반환 (+{mat['paid_total']} 포인트)")
 
-# 데이터 로드
-refresh_account_data(name, pin, force=False)
+# 데이터 로드 (방금 만기 지급이 있었으면 새로 불러오기)
+matured_now = bool(mat and mat.get("ok") and mat.get("matured_count", 0) > 0)
+refresh_account_data(name, token, force=matured_now)
 slot = st.session_state.data.get(name, {})
 if slot.get("error"):
     st.error(slot["error"])
@@ -637,11 +1228,11 @@ with sub1:
                 if withdraw > 0 and withdraw > balance:
                     st.error("출금 금액이 현재 잔액보다 커요.")
                 else:
-                    res = api_add_tx(name, pin, memo, deposit, withdraw)
+                    res = api_add_tx(token, memo, deposit, withdraw)
                     if res.get("ok"):
                         toast("저장 완료!", icon="✅")
                         st.session_state[clear_flag] = True
-                        refresh_account_data(name, pin, force=True)
+                        refresh_account_data(name, token, force=True)
                         st.rerun()
                     else:
                         st.error(res.get("error", "저장 실패"))
@@ -656,11 +1247,11 @@ with sub1:
         y, n = st.columns(2)
         with y:
             if st.button("예", key=f"undo_yes_{name}"):
-                res = api_undo_last_n(name, pin, undo_n)
+                res = api_undo_last_n(token, undo_n)
                 if res.get("ok"):
                     toast(f"최근 {undo_n}건 되돌림 완료", icon="↩️")
                     st.session_state[f"undo_confirm_{name}"] = False
-                    refresh_account_data(name, pin, force=True)
+                    refresh_account_data(name, token, force=True)
                     st.rerun()
                 else:
                     st.error(res.get("error", "되돌리기 실패"))
@@ -690,65 +1281,79 @@ with sub2:
         st.warning("⚠️ 현재 잔액보다 원금이 커서 가입할 수 없어요.")
 
     if st.button("적금 가입", key=f"sv_join_{name}", disabled=(p > balance)):
-        res = api_savings_create(name, pin, int(p), int(w))
+        res = api_savings_create(token, int(p), int(w))
         if res.get("ok"):
             toast("적금 가입 완료!", icon="💰")
-            refresh_account_data(name, pin, force=True)
+            refresh_account_data(name, token, force=True)
             st.rerun()
         else:
             st.error(res.get("error", "적금 가입 실패"))
 
     st.divider()
 
-    savings = st.session_state.data.get(name, {}).get("savings", [])
+    sv_index = st.session_state.data.get(name, {}).get("savings_index") or index_savings([])
+    active = sv_index["active"]
+    matured = sv_index["matured"]
+    canceled = sv_index["canceled"]
+
+    def savings_table(rows, cols):
+        view = rows.rename(
+            columns={"principal": "원금", "weeks": "기간(주)", "interest": "이자", "payout": "만기 수령액"}
+        )
+        st.dataframe(view[cols], use_container_width=True, hide_index=True)
 
-    if not savings:
+    if len(active) + len(matured) + len(canceled) == 0:
         st.info("적금이 아직 없어요.")
     else:
-        active = [s for s in savings if s.get("status") == "active"]
-        matured = [s for s in savings if s.get("status") == "matured"]
-        canceled = [s for s in savings if s.get("status") == "canceled"]
+        m1, m2, m3 = st.columns(3)
+        m1.metric("진행 중", f"{len(active)}건")
+        m2.metric("원금 합계", f"{sv_index['active_principal']}")
+        m3.metric("만기 수령 예정", f"{sv_index['active_payout']}")
 
-        if active:
+        nxt = sv_index["next_maturity"]
+        if nxt is not None:
+            st.caption(f"⏰ 다음 만기: **{nxt['만기일']}** (+{int(nxt['payout'])})")
+
+        if len(active):
             st.markdown("### 🟢 진행 중 적금")
-            for s in active:
-                sid = s["savings_id"]
-                principal = int(s["principal"])
-                weeks = int(s["weeks"])
-                interest2 = int(s["interest"])
-                maturity_dt = format_kr_datetime(s["maturity_datetime"])
-                st.write(f"- 원금 **{principal}**, 기간 **{weeks}주**, 만기일 **{maturity_dt}**, 만기 이자 **{interest2}**")
-
-                if st.button("해지", key=f"sv_cancel_btn_{name}_{sid}"):
-                    st.session_state[f"sv_cancel_confirm_{sid}"] = True
-
-                if st.session_state.get(f"sv_cancel_confirm_{sid}", False):
-                    st.warning("정말로 해지하시겠습니까? (원금만 반환)")
-                    y, n = st.columns(2)
-                    with y:
-                        if st.button("예", key=f"sv_cancel_yes_{name}_{sid}"):
-                            res = api_savings_cancel(name, pin, sid)
-                            if res.get("ok"):
-                                toast(f"해지 완료! (+{res.get('refunded', 0)})", icon="🧾")
-                                st.session_state[f"sv_cancel_confirm_{sid}"] = False
-                                refresh_account_data(name, pin, force=True)
-                                st.rerun()
-                            else:
-                                st.error(res.get("error", "해지 실패"))
-                    with n:
-                        if st.button("아니오", key=f"sv_cancel_no_{name}_{sid}"):
-                            st.session_state[f"sv_cancel_confirm_{sid}"] = False
+            savings_table(active, ["원금", "기간(주)", "만기일", "이자", "만기 수령액"])
+
+            sv_ids = active["savings_id"].tolist()
+            sv_labels = {
+                sid: f"원금 {principal} · {weeks}주 · 만기 {due}"
+                for sid, principal, weeks, due in zip(active["savings_id"], active["principal"], active["weeks"], active["만기일"])
+            }
+            cancel_key = f"sv_cancel_confirm_{name}"
+            sid = st.selectbox("해지할 적금", sv_ids, format_func=lambda i: sv_labels[i], key=f"sv_cancel_pick_{name}")
+
+            if st.button("해지", key=f"sv_cancel_btn_{name}"):
+                st.session_state[cancel_key] = sid
+
+            if st.session_state.get(cancel_key) in sv_ids:
+                st.warning(f"정말로 해지하시겠습니까? (원금만 반환)\n\n{sv_labels[st.session_state[cancel_key]]}")
+                y, n = st.columns(2)
+                with y:
+                    if st.button("예", key=f"sv_cancel_yes_{name}"):
+                        res = api_savings_cancel(token, st.session_state[cancel_key])
+                        if res.get("ok"):
+                            toast(f"해지 완료! (+{res.get('refunded', 0)})", icon="🧾")
+                            st.session_state.pop(cancel_key, None)
+                            refresh_account_data(name, token, force=True)
                             st.rerun()
+                        else:
+                            st.error(res.get("error", "해지 실패"))
+                with n:
+                    if st.button("아니오", key=f"sv_cancel_no_{name}"):
+                        st.session_state.pop(cancel_key, None)
+                        st.rerun()
 
-        if matured:
-            st.markdown("### 🔵 만기(자동 반환 완료)")
-            for s in matured[:10]:
-                st.write(f"- 원금 {int(s['principal'])}, {int(s['weeks'])}주, 이자 {int(s['interest'])}")
+        if len(matured):
+            with st.expander(f"🔵 만기(자동 반환 완료) {len(matured)}건", expanded=False):
+                savings_table(matured.iloc[::-1], ["원금", "기간(주)", "이자", "만기 수령액", "만기일"])
 
-        if canceled:
-            st.markdown("### ⚪ 해지 기록")
-            for s in canceled[:10]:
-                st.write(f"- 원금 {int(s['principal'])}, {int(s['weeks'])}주")
+        if len(canceled):
+            with st.expander(f"⚪ 해지 기록 {len(canceled)}건", expanded=False):
+                savings_table(canceled.iloc[::-1], ["원금", "기간(주)", "만기일"])
 
 # -------------------------
 # 3) 목표
@@ -782,10 +1387,10 @@ with sub3:
             g_date = st.date_input("목표 날짜", value=default_date, key=f"goal_date_{name}")
 
         if st.button("목표 저장", key=f"goal_save_{name}"):
-            res = api_set_goal(name, pin, int(g_amt), g_date.isoformat())
+            res = api_set_goal(token, int(g_amt), g_date.isoformat())
             if res.get("ok"):
                 toast("목표 저장 완료!", icon="🎯")
-                refresh_account_data(name, pin, force=True)
+                refresh_account_data(name, token, force=True)
                 st.rerun()
             else:
                 st.error(res.get("error", "목표 저장 실패"))
@@ -794,19 +1399,8 @@ with sub3:
         goal_date = g_date
 
         current_balance = int(balance)
-        savings_list = st.session_state.data.get(name, {}).get("savings", [])
-
-        bonus = 0
-        for s in savings_list:
-            if str(s.get("status", "")).lower() != "active":
-                continue
-            m_date = parse_iso_to_date(s.get("maturity_datetime", ""))
-            if not m_date:
-                continue
-            if m_date <= goal_date:
-                principal = int(float(s.get("principal", 0) or 0))
-                interest3 = int(float(s.get("interest", 0) or 0))
-                bonus += (principal + interest3)
+        sv_index = st.session_state.data.get(name, {}).get("savings_index") or index_savings([])
+        bonus = savings_payout_until(sv_index, goal_date)
 
         expected_amount = current_balance + bonus
 
@@ -824,14 +1418,56 @@ with sub3:
         else:
             st.caption(f"목표 날짜({goal_date.isoformat()}) 이전 만기 적금이 없어 예상 금액은 현재 잔액과 같아요.")
 
+# =========================
+# 잔액 그래프
+# =========================
+st.subheader("📈 잔액 변화")
+if len(df) < 2:
+    st.caption("거래가 2건 이상 쌓이면 그래프가 보여요.")
+else:
+    digest = slot.get("digest", {})
+    points = balance_chart_points(name, f"{digest.get('count')}:{digest.get('hash')}", df)
+    st.altair_chart(balance_chart(points, slot["savings_index"], slot.get("goal", {})), use_container_width=True)
+    if len(df) > len(points):
+        st.caption(f"거래 {len(df)}건 중 {len(points)}개 점으로 요약해서 그렸어요. · 초록 점선=적금 만기, 빨간 선=목표")
+    else:
+        st.caption("초록 점선=적금 만기, 빨간 선=목표")
+
 # =========================
 # 통장 내역
 # =========================
 st.subheader("📒 통장 내역")
-if len(df) == 0:
-    st.info("아직 거래 내역이 없어요.")
-else:
-    view = df.rename(columns={"datetime": "날짜-시간", "memo": "내역", "deposit": "입금", "withdraw": "출금"})[
+checkpoint = slot.get("checkpoint")
+if checkpoint:
+    st.caption(
+        f"📦 {format_kr_datetime(checkpoint.get('as_of'))} 이전 기록 {int(checkpoint.get('archived_count', 0) or 0)}건은 보관됨 "
+        f"(이월 잔액 {int(float(checkpoint.get('balance', 0) or 0))})"
+    )
+
+def show_ledger(ledger_df):
+    view = ledger_df.rename(columns={"datetime": "날짜-시간", "memo": "내역", "deposit": "입금", "withdraw": "출금"})[
         ["날짜-시간", "내역", "입금", "출금", "총액"]
     ]
     st.dataframe(view, use_container_width=True, hide_index=True)
+
+if len(df) == 0:
+    st.info("최근 거래 내역이 없어요." if checkpoint else "아직 거래 내역이 없어요.")
+else:
+    show_ledger(df)
+
+if checkpoint:
+    with st.expander("🗂️ 전체 내역 보기(보관 기록 포함)", expanded=False):
+        archive_key = f"archive_{name}"
+        if st.button("전체 내역 불러오기", key=f"archive_btn_{name}"):
+            ares = api_get_archived_txs(token)
+            if ares.get("ok"):
+                st.session_state[archive_key] = build_df(
+                    ares.get("headers", ["tx_id", "datetime", "memo", "deposit", "withdraw"]), ares.get("rows", [])
+                )
+            else:
+                st.error(ares.get("error", "전체 내역 로드 실패"))
+        if archive_key in st.session_state:
+            show_ledger(st.session_state[archive_key])
+
+# 화면을 다 그린 뒤 다음 계정 미리 불러오기
+prefetch_accounts(name, filtered)
@@ -0,0 +1,30 @@
+"""앱(app.py)과 저장소 백엔드가 함께 쓰는 규칙 (Streamlit/DB 의존 없음)"""
+from datetime import timezone, timedelta
+
+KST = timezone(timedelta(hours=9))
+
+def pin_ok(pin) -> bool:
+    return isinstance(pin, str) and pin.isdigit() and len(pin) == 4
+
+def rate_by_weeks(weeks: int) -> float:
+    return weeks * 0.05  # 1주=5%
+
+def savings_interest(principal: int, weeks: int) -> int:
+    """적금 이자 (미리보기와 실제 지급 공통)"""
+    return round(principal * rate_by_weeks(weeks))
+
+def digest_rows(rows, checkpoint=None) -> dict:
+    """(tx_id, deposit, withdraw) 행 → (행 수, FNV-1a 32bit 롤링 해시)
+    체크포인트가 있으면 "checkpoint|잔액|보관건수" 줄을 먼저 해시"""
+    lines = []
+    if checkpoint:
+        lines.append(f"checkpoint|{int(checkpoint['balance'])}|{int(checkpoint['archived_count'])}\n")
+    for tx_id, deposit, withdraw in rows:
+        lines.append(f"{tx_id}|{int(deposit)}|{int(withdraw)}\n")
+
+    h = 0x811C9DC5
+    for line in lines:
+        for b in line.encode("utf-8"):
+            h ^= b
+            h = (h * 0x01000193) & 0xFFFFFFFF
+    return {"count": len(rows), "hash": f"{h:08x}"}
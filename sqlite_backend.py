@@ -0,0 +1,512 @@
+"""내장 SQLite 저장소 (Apps Script 웹앱 대신 사용하는 자체 호스팅용 백엔드)
+
+app.py의 api_get/api_post와 같은 요청({"action": ..., ...})을 받아
+Apps Script와 같은 모양의 응답 dict를 돌려준다.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from bank_rules import KST, digest_rows, pin_ok, savings_interest
+
+TX_HEADERS = ["tx_id", "datetime", "memo", "deposit", "withdraw"]
+TOKEN_TTL_SEC = 30 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    name        TEXT PRIMARY KEY,
+    pin_salt    TEXT NOT NULL,
+    pin_hash    TEXT NOT NULL,
+    created_at  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+    tx_id     TEXT NOT NULL UNIQUE,
+    name      TEXT NOT NULL REFERENCES accounts(name) ON DELETE CASCADE,
+    datetime  TEXT NOT NULL,
+    memo      TEXT NOT NULL,
+    deposit   INTEGER NOT NULL DEFAULT 0,
+    withdraw  INTEGER NOT NULL DEFAULT 0,
+    archived  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tx_name ON transactions(name, archived, seq);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name            TEXT PRIMARY KEY REFERENCES accounts(name) ON DELETE CASCADE,
+    balance         INTEGER NOT NULL,
+    as_of           TEXT NOT NULL,
+    archived_count  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS savings (
+    savings_id         TEXT PRIMARY KEY,
+    name               TEXT NOT NULL REFERENCES accounts(name) ON DELETE CASCADE,
+    principal          INTEGER NOT NULL,
+    weeks              INTEGER NOT NULL,
+    interest           INTEGER NOT NULL,
+    start_datetime     TEXT NOT NULL,
+    maturity_datetime  TEXT NOT NULL,
+    status             TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_savings_name ON savings(name, status, maturity_datetime);
+CREATE TABLE IF NOT EXISTS goals (
+    name         TEXT PRIMARY KEY REFERENCES accounts(name) ON DELETE CASCADE,
+    goal_amount  INTEGER NOT NULL,
+    goal_date    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id  TEXT PRIMARY KEY,
+    name        TEXT NOT NULL REFERENCES accounts(name) ON DELETE CASCADE,
+    expires_at  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_name ON sessions(name);
+CREATE TABLE IF NOT EXISTS templates (
+    template_id  TEXT PRIMARY KEY,
+    label        TEXT NOT NULL,
+    kind         TEXT NOT NULL,
+    amount       INTEGER NOT NULL
+);
+"""
+
+
+class BackendError(Exception):
+    def __init__(self, error, error_code=None):
+        super().__init__(error)
+        self.error = error
+        self.error_code = error_code
+
+
+def now_iso() -> str:
+    return datetime.now(KST).isoformat(timespec="seconds")
+
+def new_id(prefix: str) -> str:
+    return f"{prefix}_{datetime.now(KST).strftime('%Y%m%d%H%M%S')}_{secrets.token_hex(4)}"
+
+def hash_pin(pin: str, salt: str) -> str:
+    return hashlib.pbkdf2_hmac("sha256", str(pin).encode(), salt.encode(), 10_000).hex()
+
+
+class SqliteBackend:
+    """스레드마다 연결 1개, WAL 모드(읽기 동시 처리), 쓰기는 BEGIN IMMEDIATE 트랜잭션"""
+
+    def __init__(self, path: str, admin_pin: str = "", token_secret: str = ""):
+        self.path = path
+        self.admin_pin = admin_pin
+        self.token_secret = (token_secret or secrets.token_hex(32)).encode()
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    # ---------- 연결/트랜잭션
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ---------- app.py의 api_get/api_post 진입점
+    def get(self, params: dict) -> dict:
+        return self.handle(params)
+
+    def post(self, payload: dict) -> dict:
+        return self.handle(payload)
+
+    def handle(self, req: dict) -> dict:
+        action = str(req.get("action", ""))
+        fn = getattr(self, f"do_{action}", None)
+        if fn is None:
+            return {"ok": False, "error": f"알 수 없는 action: {action}"}
+        try:
+            res = fn(req)
+        except BackendError as e:
+            out = {"ok": False, "error": e.error}
+            if e.error_code:
+                out["error_code"] = e.error_code
+            return out
+        except sqlite3.IntegrityError as e:
+            if "FOREIGN KEY" in str(e):
+                return {"ok": False, "error": "계정을 찾을 수 없어요."}
+            return {"ok": False, "error": f"DB 오류: {e}"}
+        except sqlite3.Error as e:
+            return {"ok": False, "error": f"DB 오류: {e}"}
+        except (ValueError, TypeError, AttributeError) as e:
+            return {"ok": False, "error": f"요청 값이 올바르지 않아요. ({e})"}
+        return {"ok": True, **res}
+
+    # ---------- 인증
+    def _sign(self, body: str) -> str:
+        return hmac.new(self.token_secret, body.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def _issue_token(self, conn, session_id: str) -> dict:
+        exp = int(datetime.now(KST).timestamp()) + TOKEN_TTL_SEC
+        conn.execute("UPDATE sessions SET expires_at = ? WHERE session_id = ?", (exp, session_id))
+        body = f"{session_id}.{exp}"
+        return {
+            "token": f"{body}.{self._sign(body)}",
+            "expires_at": datetime.fromtimestamp(exp, KST).isoformat(timespec="seconds"),
+        }
+
+    def _token_session(self, req: dict) -> str:
+        """서명/만료 확인(DB 조회 없음) → session_id"""
+        try:
+            session_id, exp, sig = str(req.get("token", "")).split(".")
+            exp = int(exp)
+        except ValueError:
+            raise BackendError("로그인 정보가 올바르지 않아요.", "TOKEN_INVALID")
+        if not hmac.compare_digest(sig.encode(), self._sign(f"{session_id}.{exp}").encode()):
+            raise BackendError("로그인 정보가 올바르지 않아요.", "TOKEN_INVALID")
+        if exp < datetime.now(KST).timestamp():
+            raise BackendError("로그인이 만료됐어요. 비밀번호를 다시 입력해 주세요.", "TOKEN_EXPIRED")
+        return session_id
+
+    def _session_name(self, conn, req: dict) -> str:
+        """매 요청 세션 확인(기본키 조회 1번): 로그아웃/PIN 재설정/계정 삭제 즉시 끊김
+        token 없이 name+pin이 오면(BANK_AUTH=pin) PIN으로 확인"""
+        if "token" not in req:
+            name = str(req.get("name", ""))
+            self._check_pin(conn, name, str(req.get("pin", "")))
+            return name
+        row = conn.execute("SELECT name FROM sessions WHERE session_id = ?", (self._token_session(req),)).fetchone()
+        if row is None:
+            raise BackendError("로그인 정보가 바뀌었어요. 비밀번호를 다시 입력해 주세요.", "TOKEN_INVALID")
+        return row[0]
+
+    def _check_pin(self, conn, name: str, pin: str):
+        row = conn.execute("SELECT pin_salt, pin_hash FROM accounts WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise BackendError("계정을 찾을 수 없어요.")
+        if not hmac.compare_digest(hash_pin(pin, row[0]), row[1]):
+            raise BackendError("비밀번호가 틀렸어요.")
+
+    def _check_admin(self, req: dict):
+        if not self.admin_pin:
+            raise BackendError("관리자 PIN이 설정되지 않았어요. (BANK_ADMIN_PIN)")
+        if not hmac.compare_digest(str(req.get("admin_pin", "")).encode(), self.admin_pin.encode()):
+            raise BackendError("관리자 PIN 틀림")
+
+    def do_login(self, req):
+        name = str(req.get("name", ""))
+        with self._write() as conn:
+            self._check_pin(conn, name, str(req.get("pin", "")))
+            conn.execute("DELETE FROM sessions WHERE expires_at < ?", (int(datetime.now(KST).timestamp()),))
+            session_id = secrets.token_hex(16)
+            conn.execute("INSERT INTO sessions VALUES (?, ?, 0)", (session_id, name))
+            return self._issue_token(conn, session_id)
+
+    def do_refresh_token(self, req):
+        with self._write() as conn:
+            self._session_name(conn, req)
+            return self._issue_token(conn, self._token_session(req))
+
+    def do_logout(self, req):
+        with self._write() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (self._token_session(req),))
+        return {}
+
+    # ---------- 내부 계산
+    def _balance(self, conn, name: str) -> int:
+        cp = conn.execute("SELECT balance FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        live = conn.execute(
+            "SELECT COALESCE(SUM(deposit - withdraw), 0) FROM transactions WHERE name = ? AND archived = 0", (name,)
+        ).fetchone()[0]
+        return (cp[0] if cp else 0) + int(live)
+
+    def _insert_tx(self, conn, name: str, memo: str, deposit: int, withdraw: int) -> str:
+        tx_id = new_id("tx")
+        conn.execute(
+            "INSERT INTO transactions (tx_id, name, datetime, memo, deposit, withdraw) VALUES (?, ?, ?, ?, ?, ?)",
+            (tx_id, name, now_iso(), memo, int(deposit), int(withdraw)),
+        )
+        return tx_id
+
+    def _checkpoint(self, conn, name: str):
+        row = conn.execute(
+            "SELECT balance, as_of, archived_count FROM checkpoints WHERE name = ?", (name,)
+        ).fetchone()
+        return {"balance": row[0], "as_of": row[1], "archived_count": row[2]} if row else None
+
+    # ---------- 계정
+    def do_list_accounts(self, req):
+        rows = self._conn().execute("SELECT name FROM accounts ORDER BY created_at, name").fetchall()
+        return {"accounts": [r[0] for r in rows]}
+
+    def _create_account(self, conn, name: str, pin: str):
+        if not name:
+            raise BackendError("이름이 비어 있어요.")
+        if not pin_ok(pin):
+            raise BackendError("비밀번호는 4자리 숫자여야 해요.")
+        if conn.execute("SELECT 1 FROM accounts WHERE name = ?", (name,)).fetchone():
+            raise BackendError("이미 있는 계정이에요.")
+        salt = secrets.token_hex(8)
+        conn.execute(
+            "INSERT INTO accounts (name, pin_salt, pin_hash, created_at) VALUES (?, ?, ?, ?)",
+            (name, salt, hash_pin(pin, salt), now_iso()),
+        )
+
+    def do_create_account(self, req):
+        with self._write() as conn:
+            self._create_account(conn, str(req.get("name", "")).strip(), str(req.get("pin", "")))
+        return {}
+
+    def do_delete_account(self, req):
+        name = str(req.get("name", ""))
+        with self._write() as conn:
+            self._check_pin(conn, name, str(req.get("pin", "")))
+            conn.execute("DELETE FROM accounts WHERE name = ?", (name,))
+        return {}
+
+    # ---------- 거래
+    def do_add_transaction(self, req):
+        deposit, withdraw = int(req.get("deposit", 0)), int(req.get("withdraw", 0))
+        if deposit < 0 or withdraw < 0 or (deposit > 0) == (withdraw > 0):
+            raise BackendError("입금/출금은 둘 중 하나만 입력해 주세요.")
+        with self._write() as conn:
+            name = self._session_name(conn, req)
+            if withdraw > self._balance(conn, name):
+                raise BackendError("잔액이 부족해요.")
+            tx_id = self._insert_tx(conn, name, str(req.get("memo", "")), deposit, withdraw)
+        return {"tx_id": tx_id}
+
+    def do_get_transactions(self, req):
+        conn = self._conn()
+        name = self._session_name(conn, req)
+        rows = conn.execute(
+            "SELECT tx_id, datetime, memo, deposit, withdraw FROM transactions "
+            "WHERE name = ? AND archived = 0 ORDER BY seq", (name,)
+        ).fetchall()
+        return {"headers": TX_HEADERS, "rows": [list(r) for r in rows], "checkpoint": self._checkpoint(conn, name)}
+
+    def do_get_archived_transactions(self, req):
+        conn = self._conn()
+        name = self._session_name(conn, req)
+        rows = conn.execute(
+            "SELECT tx_id, datetime, memo, deposit, withdraw FROM transactions WHERE name = ? ORDER BY seq", (name,)
+        ).fetchall()
+        return {"headers": TX_HEADERS, "rows": [list(r) for r in rows]}
+
+    def do_undo_last_n(self, req):
+        n = max(0, int(req.get("n", 1)))
+        with self._write() as conn:
+            name = self._session_name(conn, req)
+            seqs = [r[0] for r in conn.execute(
+                "SELECT seq FROM transactions WHERE name = ? AND archived = 0 ORDER BY seq DESC LIMIT ?", (name, n)
+            ).fetchall()]
+            if len(seqs) < n:
+                raise BackendError("되돌릴 거래가 부족해요. (보관된 기록은 되돌릴 수 없어요)")
+            conn.executemany("DELETE FROM transactions WHERE seq = ?", [(s,) for s in seqs])
+        return {"undone": len(seqs)}
+
+    # ---------- 적금
+    def do_list_savings(self, req):
+        conn = self._conn()
+        name = self._session_name(conn, req)
+        cols = ["savings_id", "principal", "weeks", "interest", "start_datetime", "maturity_datetime", "status"]
+        rows = conn.execute(
+            f"SELECT {', '.join(cols)} FROM savings WHERE name = ? ORDER BY start_datetime DESC", (name,)
+        ).fetchall()
+        return {"savings": [dict(zip(cols, r)) for r in rows]}
+
+    def do_savings_create(self, req):
+        principal, weeks = int(req.get("principal", 0)), int(req.get("weeks", 0))
+        if principal <= 0 or principal % 10 != 0:
+            raise BackendError("적금 원금은 10단위여야 해요.")
+        if not 1 <= weeks <= 10:
+            raise BackendError("기간은 1~10주여야 해요.")
+        interest = savings_interest(principal, weeks)
+        start = datetime.now(KST)
+        with self._write() as conn:
+            name = self._session_name(conn, req)
+            if principal > self._balance(conn, name):
+                raise BackendError("잔액이 부족해요.")
+            sid = new_id("sv")
+            conn.execute(
+                "INSERT INTO savings VALUES (?, ?, ?, ?, ?, ?, ?, 'active')",
+                (sid, name, principal, weeks, interest, start.isoformat(timespec="seconds"),
+                 (start + timedelta(days=weeks * 7)).isoformat(timespec="seconds")),
+            )
+            self._insert_tx(conn, name, f"적금 가입({weeks}주)", 0, principal)
+        return {"savings_id": sid}
+
+    def do_savings_cancel(self, req):
+        with self._write() as conn:
+            name = self._session_name(conn, req)
+            row = conn.execute(
+                "SELECT principal FROM savings WHERE savings_id = ? AND name = ? AND status = 'active'",
+                (str(req.get("savings_id", "")), name),
+            ).fetchone()
+            if row is None:
+                raise BackendError("진행 중인 적금을 찾을 수 없어요.")
+            conn.execute("UPDATE savings SET status = 'canceled' WHERE savings_id = ?", (str(req.get("savings_id")),))
+            self._insert_tx(conn, name, "적금 해지(원금 반환)", row[0], 0)
+        return {"refunded": row[0]}
+
+    def do_process_maturities(self, req):
+        with self._write() as conn:
+            name = self._session_name(conn, req)
+            due = conn.execute(
+                "SELECT savings_id, principal, interest FROM savings "
+                "WHERE name = ? AND status = 'active' AND maturity_datetime <= ?", (name, now_iso())
+            ).fetchall()
+            paid = 0
+            for sid, principal, interest in due:
+                conn.execute("UPDATE savings SET status = 'matured' WHERE savings_id = ?", (sid,))
+                self._insert_tx(conn, name, "적금 만기(원금+이자)", principal + interest, 0)
+                paid += principal + interest
+        return {"matured_count": len(due), "paid_total": paid}
+
+    # ---------- 목표
+    def do_get_goal(self, req):
+        conn = self._conn()
+        name = self._session_name(conn, req)
+        row = conn.execute("SELECT goal_amount, goal_date FROM goals WHERE name = ?", (name,)).fetchone()
+        return {"goal_amount": row[0] if row else 0, "goal_date": row[1] if row else ""}
+
+    def do_set_goal(self, req):
+        with self._write() as conn:
+            name = self._session_name(conn, req)
+            conn.execute(
+                "INSERT INTO goals VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+                "goal_amount = excluded.goal_amount, goal_date = excluded.goal_date",
+                (name, int(req.get("goal_amount", 0)), str(req.get("goal_date", ""))),
+            )
+        return {}
+
+    # ---------- 템플릿
+    def do_list_templates(self, req):
+        rows = self._conn().execute("SELECT template_id, label, kind, amount FROM templates ORDER BY label").fetchall()
+        return {"templates": [dict(zip(["template_id", "label", "kind", "amount"], r)) for r in rows]}
+
+    def do_admin_upsert_template(self, req):
+        self._check_admin(req)
+        kind = str(req.get("kind", ""))
+        if kind not in ("deposit", "withdraw"):
+            raise BackendError("종류는 deposit/withdraw만 가능해요.")
+        tid = str(req.get("template_id", "")) or new_id("tpl")
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO templates VALUES (?, ?, ?, ?) ON CONFLICT(template_id) DO UPDATE SET "
+                "label = excluded.label, kind = excluded.kind, amount = excluded.amount",
+                (tid, str(req.get("label", "")), kind, int(req.get("amount", 0))),
+            )
+        return {"template_id": tid}
+
+    def do_admin_delete_template(self, req):
+        self._check_admin(req)
+        with self._write() as conn:
+            conn.execute("DELETE FROM templates WHERE template_id = ?", (str(req.get("template_id", "")),))
+        return {}
+
+    # ---------- 관리자
+    def do_admin_balances(self, req):
+        self._check_admin(req)
+        conn = self._conn()
+        names = [r[0] for r in conn.execute("SELECT name FROM accounts ORDER BY name").fetchall()]
+        return {"balances": [{"name": n, "balance": self._balance(conn, n)} for n in names]}
+
+    def do_admin_reset_pin(self, req):
+        self._check_admin(req)
+        name, new_pin = str(req.get("name", "")), str(req.get("new_pin", ""))
+        if not pin_ok(new_pin):
+            raise BackendError("새 PIN은 4자리 숫자여야 해요.")
+        salt = secrets.token_hex(8)
+        with self._write() as conn:
+            cur = conn.execute(
+                "UPDATE accounts SET pin_salt = ?, pin_hash = ? WHERE name = ?", (salt, hash_pin(new_pin, salt), name)
+            )
+            if cur.rowcount == 0:
+                raise BackendError("계정을 찾을 수 없어요.")
+            conn.execute("DELETE FROM sessions WHERE name = ?", (name,))  # 기존 로그인 모두 끊기
+        return {}
+
+    def do_admin_backup(self, req):
+        self._check_admin(req)
+        backup_name = f"{os.path.splitext(self.path)[0]}-backup-{datetime.now(KST).strftime('%Y%m%d-%H%M%S')}.db"
+        dst = sqlite3.connect(backup_name)
+        try:
+            self._conn().backup(dst)
+        finally:
+            dst.close()
+        return {"backup_name": os.path.basename(backup_name)}
+
+    def do_admin_bulk_deposit(self, req):
+        self._check_admin(req)
+        amount = int(req.get("amount", 0))
+        if amount <= 0:
+            raise BackendError("지급 포인트는 1 이상이어야 해요.")
+        memo = str(req.get("memo", ""))
+        with self._write() as conn:
+            names = [r[0] for r in conn.execute("SELECT name FROM accounts").fetchall()]
+            for n in names:
+                self._insert_tx(conn, n, memo, amount, 0)
+        return {"count": len(names)}
+
+    def do_admin_bulk_create_accounts(self, req):
+        self._check_admin(req)
+        results = []
+        with self._write() as conn:
+            for acc in req.get("accounts", []) or []:
+                if not isinstance(acc, dict):
+                    results.append({"name": str(acc), "ok": False, "error": "형식이 올바르지 않아요."})
+                    continue
+                name = str(acc.get("name", "")).strip()
+                conn.execute("SAVEPOINT row")
+                try:
+                    self._create_account(conn, name, str(acc.get("pin", "")))
+                    conn.execute("RELEASE row")
+                    results.append({"name": name, "ok": True})
+                except BackendError as e:
+                    conn.execute("ROLLBACK TO row")
+                    conn.execute("RELEASE row")
+                    results.append({"name": name, "ok": False, "error": e.error})
+        return {"results": results}
+
+    def do_admin_ledger_digests(self, req):
+        self._check_admin(req)
+        conn = self._conn()
+        digests = {}
+        for (name,) in conn.execute("SELECT name FROM accounts").fetchall():
+            rows = conn.execute(
+                "SELECT tx_id, deposit, withdraw FROM transactions WHERE name = ? AND archived = 0 ORDER BY seq", (name,)
+            ).fetchall()
+            digests[name] = digest_rows(rows, self._checkpoint(conn, name))
+        return {"digests": digests}
+
+    def do_admin_checkpoint(self, req):
+        self._check_admin(req)
+        keep_days = int(req.get("keep_days", 28))
+        if keep_days < 1:
+            raise BackendError("최근 1일 이상은 남겨 둬야 해요. (keep_days ≥ 1)")
+        cutoff = (datetime.now(KST) - timedelta(days=keep_days)).isoformat(timespec="seconds")
+        archived = 0
+        with self._write() as conn:
+            old = conn.execute(
+                "SELECT name, COUNT(*), COALESCE(SUM(deposit - withdraw), 0) FROM transactions "
+                "WHERE archived = 0 AND datetime < ? GROUP BY name", (cutoff,)
+            ).fetchall()
+            for name, count, delta in old:
+                conn.execute(
+                    "INSERT INTO checkpoints VALUES (?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+                    "balance = balance + excluded.balance, as_of = excluded.as_of, "
+                    "archived_count = archived_count + excluded.archived_count",
+                    (name, int(delta), cutoff, count),
+                )
+                archived += count
+            conn.execute("UPDATE transactions SET archived = 1 WHERE archived = 0 AND datetime < ?", (cutoff,))
+        return {"archived": archived}